@@ -47,9 +47,13 @@ def main(_):
         shape = (1, ssd_shape[0], ssd_shape[1], 3)
         img_input = tf.placeholder(shape=shape, dtype=tf.float32)
         
-        # Create model.
+        # Create model. SSD 512: explicit Caffe padding of the stride 2
+        # convolutions, the geometry the weights were trained with.
+        net_kwargs = {}
+        if FLAGS.model_name == 'ssd_512_vgg':
+            net_kwargs['caffe_padding'] = True
         with slim.arg_scope(ssd_net.arg_scope_caffe(caffemodel)):
-            ssd_net.net(img_input, is_training=False)
+            ssd_net.net(img_input, is_training=False, **net_kwargs)
 
         init_op = tf.global_variables_initializer()
         with tf.Session() as session:
@@ -0,0 +1,112 @@
+"""Convert a SSD 512 checkpoint written with separate multibox layers.
+
+Older checkpoints hold separate `conv_loc` / `conv_cls` prediction layers
+and a fixed L2 normalization scale. The converted checkpoint holds the fused
+`conv_combined` layers (c.f. `tf_utils.get_fused_multibox_value`) and the
+learned `L2Normalization/gamma` scales, set to the layer normalization
+value, including optimizer slots and moving averages. It can then be
+evaluated, tested or used to resume a training.
+"""
+import numpy as np
+import tensorflow as tf
+
+import tf_utils
+from nets import nets_factory
+
+# =========================================================================== #
+# Main flags.
+# =========================================================================== #
+tf.app.flags.DEFINE_string(
+    'model_name', 'ssd_512_vgg', 'Name of the model of the checkpoint.')
+tf.app.flags.DEFINE_string(
+    'checkpoint_path', None, 'The path to the checkpoint to convert.')
+tf.app.flags.DEFINE_string(
+    'output_path', None,
+    'The path of the converted checkpoint. Default: checkpoint_path + "_fused".')
+
+FLAGS = tf.app.flags.FLAGS
+
+
+def convert_values(reader):
+    """Read the checkpoint values, fusing the multibox layers.
+
+    Return:
+      Dictionary of checkpoint names to numpy arrays.
+    """
+    values = {}
+    for name in reader.get_variable_to_shape_map():
+        if 'conv_cls' in name:
+            continue
+        if 'conv_loc' in name:
+            fused_name = name.replace('conv_loc', 'conv_combined')
+            value = tf_utils.get_fused_multibox_value(reader, fused_name)
+            if value is None:
+                raise ValueError('No conv_cls counterpart for %s' % name)
+            values[fused_name] = value
+        else:
+            values[name] = reader.get_tensor(name)
+    return values
+
+
+def add_l2_normalization_values(values, params):
+    """Add the L2 normalization scales missing from the checkpoint values:
+    set to the layer normalization value, moving averages included, and to
+    zero for the optimizer slots.
+    """
+    for layer, normalization in zip(params.feat_layers, params.normalizations):
+        if normalization <= 0:
+            continue
+        weights_name = '/%s_box/conv_combined/weights' % layer
+        gamma_name = '/%s_box/L2Normalization/gamma' % layer
+        for name in list(values.keys()):
+            idx = name.find(weights_name)
+            if idx < 0:
+                continue
+            suffix = name[idx + len(weights_name):]
+            new_name = name[:idx] + gamma_name + suffix
+            if new_name in values:
+                continue
+            # Number of input channels of the multibox convolution.
+            shape = values[name].shape[2:3]
+            if suffix in ('', '/ExponentialMovingAverage'):
+                values[new_name] = np.full(shape, normalization, dtype=np.float32)
+            else:
+                values[new_name] = np.zeros(shape, dtype=np.float32)
+    return values
+
+
+# =========================================================================== #
+# Main converting routine.
+# =========================================================================== #
+def main(_):
+    if not FLAGS.checkpoint_path:
+        raise ValueError('You must supply the checkpoint with --checkpoint_path')
+    if tf.gfile.IsDirectory(FLAGS.checkpoint_path):
+        checkpoint_path = tf.train.latest_checkpoint(FLAGS.checkpoint_path)
+    else:
+        checkpoint_path = FLAGS.checkpoint_path
+    output_path = FLAGS.output_path or checkpoint_path + '_fused'
+
+    tf.logging.set_verbosity(tf.logging.INFO)
+    reader = tf.train.NewCheckpointReader(checkpoint_path)
+    values = convert_values(reader)
+    params = nets_factory.get_network(FLAGS.model_name).default_params
+    values = add_l2_normalization_values(values, params)
+    with tf.Graph().as_default():
+        # Values fed through placeholders: no constants in the graph.
+        feed_dict = {}
+        variables = {}
+        for i, (name, value) in enumerate(sorted(values.items())):
+            placeholder = tf.placeholder(tf.as_dtype(value.dtype),
+                                         shape=value.shape)
+            variables[name] = tf.Variable(placeholder, name='var_%d' % i)
+            feed_dict[placeholder] = value
+        saver = tf.train.Saver(variables, write_version=2)
+        with tf.Session() as session:
+            session.run(tf.global_variables_initializer(), feed_dict=feed_dict)
+            saver.save(session, output_path, write_meta_graph=False)
+    tf.logging.info('Converted %s to %s' % (checkpoint_path, output_path))
+
+
+if __name__ == '__main__':
+    tf.app.run()
@@ -241,7 +241,7 @@ def _gather_clone_loss(clone, num_clones, regularization_losses):
 
 
 def _optimize_clone(optimizer, clone, num_clones, regularization_losses,
-                                        **kwargs):
+                                        loss_scale=1.0, **kwargs):
     """Compute losses and gradients for a single clone.
 
     Args:
@@ -250,6 +250,8 @@ def _optimize_clone(optimizer, clone, num_clones, regularization_losses,
         num_clones: The number of clones being deployed.
         regularization_losses: Possibly empty list of regularization_losses
             to add to the clone losses.
+        loss_scale: Static loss scale: the loss is multiplied by it before
+            computing the gradients, which are divided back by it.
         **kwargs: Dict of kwarg to pass to compute_gradients().
 
     Returns:
@@ -262,12 +264,40 @@ def _optimize_clone(optimizer, clone, num_clones, regularization_losses,
     clone_grad = None
     if sum_loss is not None:
         with tf.device(clone.device):
-            clone_grad = optimizer.compute_gradients(sum_loss, **kwargs)
+            if loss_scale == 1.0:
+                clone_grad = optimizer.compute_gradients(sum_loss, **kwargs)
+            else:
+                clone_grad = optimizer.compute_gradients(sum_loss * loss_scale,
+                                                         **kwargs)
+                clone_grad = _unscale_gradients(clone_grad, loss_scale)
     return sum_loss, clone_grad
 
 
+def _unscale_gradients(grads_and_vars, loss_scale):
+    """Divide the gradients by the static loss scale.
+
+    Args:
+        grads_and_vars: List of (gradient, variable).
+        loss_scale: The loss scale used to compute the gradients.
+
+    Returns:
+        List of (gradient, variable) of the unscaled loss.
+    """
+    unscaled = []
+    for grad, var in grads_and_vars:
+        if grad is not None:
+            if isinstance(grad, tf.IndexedSlices):
+                grad = tf.IndexedSlices(grad.values / loss_scale,
+                                        grad.indices, grad.dense_shape)
+            else:
+                grad = grad / loss_scale
+        unscaled.append((grad, var))
+    return unscaled
+
+
 def optimize_clones(clones, optimizer,
                     regularization_losses=None,
+                    loss_scale=1.0,
                     **kwargs):
     """Compute clone losses and gradients for the given list of `Clones`.
 
@@ -279,6 +309,8 @@ def optimize_clones(clones, optimizer,
       regularization_losses: Optional list of regularization losses. If None it
          will gather them from tf.GraphKeys.REGULARIZATION_LOSSES. Pass `[]` to
          exclude them.
+      loss_scale: Optional static loss scale, to keep the small gradients of
+         a reduced precision network from underflowing.
       **kwargs: Optional list of keyword arguments to pass to `compute_gradients`.
 
     Returns:
@@ -299,7 +331,8 @@ def optimize_clones(clones, optimizer,
     for clone in clones:
         with tf.name_scope(clone.scope):
             clone_loss, clone_grad = _optimize_clone(
-                    optimizer, clone, num_clones, regularization_losses, **kwargs)
+                    optimizer, clone, num_clones, regularization_losses,
+                    loss_scale=loss_scale, **kwargs)
             if clone_loss is not None:
                 clones_losses.append(clone_loss)
                 grads_and_vars.append(clone_grad)
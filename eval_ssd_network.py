@@ -31,12 +31,6 @@ from preprocessing import preprocessing_factory
 
 slim = tf.contrib.slim
 
-# =========================================================================== #
-# Some default EVAL parameters
-# =========================================================================== #
-# List of recalls values at which precision is evaluated.
-DATA_FORMAT = 'NHWC'
-
 # =========================================================================== #
 # SSD evaluation Flags.
 # =========================================================================== #
@@ -56,6 +50,13 @@ tf.app.flags.DEFINE_integer(
     'eval_image_size', None, 'Eval image size.')
 tf.app.flags.DEFINE_boolean(
     'remove_difficult', True, 'Remove difficult objects from evaluation.')
+tf.app.flags.DEFINE_string(
+    'data_format', 'NHWC',
+    'Data format of the network, "NHWC" or "NCHW" (GPU only).')
+tf.app.flags.DEFINE_boolean(
+    'caffe_padding', False,
+    'Explicit (1, 1) padding of the Caffe model in the stride 2 convolutions '
+    'of blocks 8 to 11, instead of SAME. Must match the training setting.')
 
 # =========================================================================== #
 # Main evaluation flags.
@@ -118,14 +119,13 @@ def main(_):
         dataset = dataset_factory.get_dataset(
             FLAGS.dataset_name, FLAGS.dataset_split_name, FLAGS.dataset_dir)
 
-        # Get the SSD network and its anchors.
+        # Get the SSD network.
         ssd_class = nets_factory.get_network(FLAGS.model_name)
         ssd_params = ssd_class.default_params._replace(num_classes=FLAGS.num_classes)
         ssd_net = ssd_class(ssd_params)
 
-        # Evaluation shape and associated anchors: eval_image_size
+        # Evaluation shape: eval_image_size
         ssd_shape = ssd_net.params.img_shape
-        ssd_anchors = ssd_net.anchors(ssd_shape)
 
         # Select the preprocessing function.
         preprocessing_name = FLAGS.preprocessing_name or FLAGS.model_name
@@ -138,6 +138,7 @@ def main(_):
         # Create a dataset provider and batches.
         # =================================================================== #
         with tf.device('/cpu:0'):
+            anchors = ssd_net.anchors_tensors(ssd_shape)
             with tf.name_scope(FLAGS.dataset_name +"_" +FLAGS.dataset_split_name +'_data_provider'):
                 provider = slim.dataset_data_provider.DatasetDataProvider(
                     dataset,
@@ -157,13 +158,13 @@ def main(_):
             image, glabels, gbboxes, gbbox_img = \
                 image_preprocessing_fn(image, glabels, gbboxes,
                                        out_shape=ssd_shape,
-                                       data_format=DATA_FORMAT,
+                                       data_format=FLAGS.data_format,
                                        resize=FLAGS.eval_resize,
                                        difficults=None)
 
             # Encode groundtruth labels and bboxes.
             gclasses, glocalizations, gscores = \
-                ssd_net.bboxes_encode(glabels, gbboxes, ssd_anchors, match_threshold = FLAGS.match_threshold)
+                ssd_net.bboxes_encode(glabels, gbboxes, anchors, match_threshold = FLAGS.match_threshold)
 
             # Evaluation batch.
             b_image, b_glabels, b_gbboxes, b_gdifficults, b_gbbox_img, b_gclasses, b_glocalizations, b_gscores = tf.train.batch(
@@ -177,10 +178,11 @@ def main(_):
         # SSD Network + Ouputs decoding.
         # =================================================================== #
         dict_metrics = {}
-        arg_scope = ssd_net.arg_scope(data_format=DATA_FORMAT)
+        arg_scope = ssd_net.arg_scope(data_format=FLAGS.data_format)
         with slim.arg_scope(arg_scope):
             predictions, localizations, logits, end_points = \
-                ssd_net.net(b_image, is_training=False)
+                ssd_net.net(b_image, is_training=False,
+                            caffe_padding=FLAGS.caffe_padding)
         # Add losses functions.
         ssd_net.losses(logits, predictions,localizations,
                        b_gclasses, b_glocalizations, b_gscores)
@@ -188,7 +190,7 @@ def main(_):
         # Performing post-processing on CPU: loop-intensive, usually more efficient.
         with tf.device('/device:CPU:0'):
             # Detected objects from SSD output.
-            localizations = ssd_net.bboxes_decode(localizations, ssd_anchors)
+            localizations = ssd_net.bboxes_decode(localizations, anchors)
             rscores, rbboxes = ssd_net.detected_bboxes(predictions, localizations,
                                         select_threshold=FLAGS.select_threshold,
                                         nms_threshold=FLAGS.nms_threshold,
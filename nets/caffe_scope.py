@@ -45,35 +45,64 @@ class CaffeScope(object):
         if bgr_to_rgb:
             self.bgr_to_rgb = 1
 
+    def conv_layers(self, counter, num_outputs):
+        """Caffe convolution layers of a TF convolution with `num_outputs`
+        channels, starting from the `counter`-th one.
+
+        Consecutive Caffe layers are stacked when they are fused into a
+        single TF convolution, e.g. the SSD mbox_loc and mbox_conf layers of
+        a feature layer (in this order) for the `conv_combined` convolution.
+
+        Returns:
+          The list of layers and the counter of the next convolution.
+        """
+        layers = []
+        channels = 0
+        while channels < num_outputs:
+            idx = self.layers['convolution'][counter]
+            layer = self.caffe_layers[idx]
+            layers.append(layer)
+            channels += layer.blobs[0].shape.dim[0]
+            counter += 1
+        if channels != num_outputs:
+            raise ValueError('Caffe convolution layers %s have %d outputs, '
+                             'expected %d.' % ([l.name for l in layers],
+                                               channels, num_outputs))
+        return layers, counter
+
     def conv_weights_init(self):
         def _initializer(shape, dtype, partition_info=None):
             counter = self.counters.get(self.conv_weights_init, 0)
-            idx = self.layers['convolution'][counter]
-            layer = self.caffe_layers[idx]
-            # Weights: reshape and transpose dimensions.
-            w = np.array(layer.blobs[0].data)
-            w = np.reshape(w, layer.blobs[0].shape.dim)
-            # w = np.transpose(w, (1, 0, 2, 3))
-            w = np.transpose(w, (2, 3, 1, 0))
-            if self.bgr_to_rgb == 1 and w.shape[2] == 3:
-                print('Convert BGR to RGB in convolution layer:', layer.name)
-                w[:, :, (0, 1, 2)] = w[:, :, (2, 1, 0)]
-                self.bgr_to_rgb += 1
-            self.counters[self.conv_weights_init] = counter + 1
-            print('Load weights from convolution layer:', layer.name, w.shape)
-            return tf.cast(w, dtype)
+            layers, counter = self.conv_layers(counter, int(shape[-1]))
+            weights = []
+            for layer in layers:
+                # Weights: reshape and transpose dimensions.
+                w = np.array(layer.blobs[0].data)
+                w = np.reshape(w, layer.blobs[0].shape.dim)
+                # w = np.transpose(w, (1, 0, 2, 3))
+                w = np.transpose(w, (2, 3, 1, 0))
+                if self.bgr_to_rgb == 1 and w.shape[2] == 3:
+                    print('Convert BGR to RGB in convolution layer:', layer.name)
+                    w[:, :, (0, 1, 2)] = w[:, :, (2, 1, 0)]
+                    self.bgr_to_rgb += 1
+                print('Load weights from convolution layer:', layer.name, w.shape)
+                weights.append(w)
+            self.counters[self.conv_weights_init] = counter
+            return tf.cast(np.concatenate(weights, axis=3), dtype)
         return _initializer
 
     def conv_biases_init(self):
         def _initializer(shape, dtype, partition_info=None):
             counter = self.counters.get(self.conv_biases_init, 0)
-            idx = self.layers['convolution'][counter]
-            layer = self.caffe_layers[idx]
-            # Biases data...
-            b = np.array(layer.blobs[1].data)
-            self.counters[self.conv_biases_init] = counter + 1
-            print('Load biases from convolution layer:', layer.name, b.shape)
-            return tf.cast(b, dtype)
+            layers, counter = self.conv_layers(counter, int(shape[-1]))
+            biases = []
+            for layer in layers:
+                # Biases data...
+                b = np.array(layer.blobs[1].data)
+                print('Load biases from convolution layer:', layer.name, b.shape)
+                biases.append(b)
+            self.counters[self.conv_biases_init] = counter
+            return tf.cast(np.concatenate(biases, axis=0), dtype)
         return _initializer
 
     def l2_norm_scale_init(self):
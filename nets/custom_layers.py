@@ -43,6 +43,40 @@ def abs_smooth(x):
     return r
 
 
+def float32_variable_getter(getter, name, shape=None, dtype=None,
+                            initializer=None, regularizer=None,
+                            trainable=True, *args, **kwargs):
+    """Custom variable getter for reduced precision layers.
+
+    Trainable variables are stored in float32 (master weights, updated by the
+    optimizer in full precision) and cast on the fly to the requested dtype.
+    To be used as `custom_getter` of a `tf.variable_scope`.
+    """
+    storage_dtype = tf.float32 if trainable else dtype
+    variable = getter(name, shape, dtype=storage_dtype,
+                      initializer=initializer, regularizer=regularizer,
+                      trainable=trainable, *args, **kwargs)
+    if trainable and dtype != tf.float32:
+        variable = tf.cast(variable, dtype)
+    return variable
+
+
+def float32_regularizer(regularizer):
+    """Wrap a weights regularizer to compute it in float32.
+
+    Layers apply their regularizer to the weights returned by the variable
+    getter, i.e. the reduced precision cast of `float32_variable_getter`:
+    the penalty is computed on the weights cast back to float32, so the
+    REGULARIZATION_LOSSES are float32 whatever the compute precision.
+    """
+    if regularizer is None:
+        return None
+
+    def fn(weights):
+        return regularizer(tf.cast(weights, tf.float32))
+    return fn
+
+
 @add_arg_scope
 def l2_normalization(
         inputs,
@@ -22,6 +22,23 @@ import tf_extended as tfe
 # =========================================================================== #
 # TensorFlow implementation of boxes SSD encoding / decoding.
 # =========================================================================== #
+def anchors_components(anchors):
+    """Get the reference centers and sizes of the anchors.
+
+    Arguments:
+      anchors: Dictionary of 1D arrays or Tensors 'cx', 'cy', 'w', 'h', or
+        Nx4 array of x / y / w / h anchors.
+    Return:
+      xref, yref, wref, href: float32 1D arrays, or the anchors Tensors.
+    """
+    if isinstance(anchors, dict):
+        return [anchors[k] if isinstance(anchors[k], tf.Tensor)
+                else np.asarray(anchors[k], dtype=np.float32)
+                for k in ['cx', 'cy', 'w', 'h']]
+    anchors = np.asarray(anchors, dtype=np.float32)
+    return anchors[:, 0], anchors[:, 1], anchors[:, 2], anchors[:, 3]
+
+
 def bipartite_match(labels,
                     bboxes,
                     anchors,
@@ -36,11 +53,7 @@ def bipartite_match(labels,
     """
     with tf.name_scope(scope):
         # Anchors coordinates and volume.
-        anchors = np.asarray(anchors, dtype = np.float32)
-        xref = anchors[:, 0]
-        yref = anchors[:, 1]
-        wref = anchors[:, 2]
-        href = anchors[:, 3]
+        xref, yref, wref, href = anchors_components(anchors)
         ymin = yref - href / 2.
         xmin = xref - wref / 2.
         ymax = yref + href / 2.
@@ -165,7 +178,7 @@ def per_prediction_match(labels,
     Arguments:
       labels: 1D Tensor(int64) containing groundtruth labels;
       bboxes: Nx4 Tensor(float) with bboxes relative coordinates;
-      anchors: List of Numpy array with layer anchors;
+      anchors: Anchors, c.f. `anchors_components`;
       matching_threshold: Threshold for positive match with groundtruth bboxes;
       prior_scaling: Scaling of encoded coordinates.
 
@@ -176,11 +189,7 @@ def per_prediction_match(labels,
 
     with tf.name_scope(scope):
         # Anchors coordinates and volume.
-        anchors = np.asarray(anchors, dtype = np.float32)
-        xref = anchors[:, 0]
-        yref = anchors[:, 1]
-        wref = anchors[:, 2]
-        href = anchors[:, 3]
+        xref, yref, wref, href = anchors_components(anchors)
         ymin = yref - href / 2.
         xmin = xref - wref / 2.
         ymax = yref + href / 2.
@@ -335,16 +344,13 @@ def tf_ssd_bboxes_decode(feat_localizations,
 
     Arguments:
       feat_localizations: List of Tensors containing localization features.
-      anchors: List of numpy array containing anchor boxes.
+      anchors: Anchors, c.f. `anchors_components`.
 
     Return:
       List of Tensors Nx4: ymin, xmin, ymax, xmax
     """
     with tf.name_scope(scope):
-        xref = anchors[:, 0]
-        yref = anchors[:, 1]
-        wref = anchors[:, 2]
-        href = anchors[:, 3]
+        xref, yref, wref, href = anchors_components(anchors)
         # Compute center, height and width
         cx = feat_localizations[:, :, 0] * wref * prior_scaling[0] + xref
         cy = feat_localizations[:, :, 1] * href * prior_scaling[1] + yref
@@ -28,7 +28,9 @@ Usage:
         outputs, end_points = ssd_vgg.ssd_vgg(inputs)
 @@ssd_vgg
 """
+import hashlib
 import math
+import os
 from collections import namedtuple
 import logging
 import numpy as np
@@ -41,6 +43,18 @@ from nets import ssd_vgg_300
 
 slim = tf.contrib.slim
 
+# Directory of the pre-computed anchors files, c.f. `ssd_anchors_cached`.
+ANCHORS_CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Version of the anchors files, part of their hash: bump it whenever the
+# anchors computation or the file layout changes, and update the name of the
+# shipped file in .gitignore.
+ANCHORS_CACHE_VERSION = 1
+
+# Compute dtype of the network for every `precision` mode.
+# bfloat16 is not supported: TF1 has no GPU Conv2D bfloat16 kernels.
+PRECISION_DTYPES = {'fp32': tf.float32,
+                    'fp16': tf.float16}
+
 
 # =========================================================================== #
 # SSD class definition.
@@ -102,6 +116,8 @@ class SSDNet(object):
             self.params = params
         else:
             self.params = SSDNet.default_params
+        # Anchors only depend on the image shape and the params: cache them.
+        self._anchor_cache = {}
 
     # ======================================================================= #
     def net(self, inputs,
@@ -110,8 +126,11 @@ class SSDNet(object):
             dropout_keep_prob=0.5,
             prediction_fn=slim.softmax,
             reuse=None,
+            precision='fp32',
+            caffe_padding=False,
             scope='ssd_512_vgg'):
-        """Network definition.
+        """Network definition. `inputs` are expected in the `data_format`
+        layout of the arg_scope.
         """
         r = ssd_net(inputs,
                     num_classes=self.params.num_classes,
@@ -123,13 +142,17 @@ class SSDNet(object):
                     dropout_keep_prob=dropout_keep_prob,
                     prediction_fn=prediction_fn,
                     reuse=reuse,
+                    precision=precision,
+                    caffe_padding=caffe_padding,
                     scope=scope)
         return r
 
     def arg_scope(self, weight_decay=0.0005, data_format='NHWC'):
         """Network arg_scope.
         """
-        return ssd_arg_scope(weight_decay, data_format=data_format)
+        # Only block4 is L2 normalized, c.f. `normalizations`.
+        return ssd_arg_scope(weight_decay, data_format=data_format,
+                             l2_norm_scale=max(self.params.normalizations))
 
     def arg_scope_caffe(self, caffe_scope):
         """Caffe arg_scope used for weights importing.
@@ -139,14 +162,31 @@ class SSDNet(object):
     # ======================================================================= #
     def anchors(self, img_shape, dtype=np.float32):
         """Compute the default anchor boxes, given an image shape.
+        The result is cached, and its component arrays are read-only.
+        """
+        key = (tuple(img_shape), np.dtype(dtype).str)
+        if key not in self._anchor_cache:
+            anchors = ssd_anchors_cached(img_shape,
+                                         self.params.feat_shapes,
+                                         self.params.anchor_sizes,
+                                         self.params.anchor_ratios,
+                                         self.params.anchor_steps,
+                                         self.params.anchor_offset,
+                                         dtype)
+            for component in anchors.values():
+                component.setflags(write=False)
+            self._anchor_cache[key] = anchors
+        return self._anchor_cache[key]
+
+    def anchors_tensors(self, img_shape, dtype=np.float32,
+                        scope='ssd_anchors'):
+        """Default anchor boxes as graph constants, built once from the
+        cached numpy anchors. Same dictionary layout as `anchors`.
         """
-        return ssd_anchors_all_layers(img_shape,
-                                      self.params.feat_shapes,
-                                      self.params.anchor_sizes,
-                                      self.params.anchor_ratios,
-                                      self.params.anchor_steps,
-                                      self.params.anchor_offset,
-                                      dtype)
+        anchors = self.anchors(img_shape, dtype)
+        with tf.name_scope(scope):
+            return dict((k, tf.constant(v, name=k))
+                        for k, v in anchors.items())
 
     def bboxes_encode(self, labels, bboxes, anchors, match_threshold, 
                       scope=None):
@@ -194,6 +234,7 @@ class SSDNet(object):
                negative_ratio=3.,
                alpha=1.,
                label_smoothing=0.,
+               add_summaries=True,
                scope='ssd_losses'):
         """Define the SSD network losses.
         """
@@ -202,6 +243,7 @@ class SSDNet(object):
                           negative_ratio=negative_ratio,
                           alpha=alpha,
                           label_smoothing=label_smoothing,
+                          add_summaries=add_summaries,
                           scope=scope)
 
 
@@ -291,7 +333,8 @@ def ssd_anchor_one_layer(img_shape,
       offset: Grid offset.
 
     Return:
-      y, x, h, w: Relative x and y grids, and height and width.
+      x, y, w, h: Flat relative x and y centers, width and height of the
+        (H, W, num_anchors) anchors, as contiguous 1D arrays.
     """
     # Compute the position grid: simple way.
     # y, x = np.mgrid[0:feat_shape[0], 0:feat_shape[1]]
@@ -302,14 +345,11 @@ def ssd_anchor_one_layer(img_shape,
     y = (y.astype(dtype) + offset) * step / img_shape[0]
     x = (x.astype(dtype) + offset) * step / img_shape[1]
 
-    # Expand dims to support easy broadcasting.
-#    y = np.expand_dims(y, axis=-1)
-#    x = np.expand_dims(x, axis=-1)
     # Compute relative height and width.
     # Tries to follow the original implementation of SSD for the order.
     num_anchors = len(sizes) + len(ratios)
-    h = [0] * num_anchors
-    w = [0] * num_anchors
+    h = np.zeros((num_anchors, ), dtype=dtype)
+    w = np.zeros((num_anchors, ), dtype=dtype)
     # Add first anchor boxes with ratio=1.
     h[0] = sizes[0] / img_shape[0]
     w[0] = sizes[0] / img_shape[1]
@@ -318,24 +358,17 @@ def ssd_anchor_one_layer(img_shape,
         h[1] = math.sqrt(sizes[0] * sizes[1]) / img_shape[0]
         w[1] = math.sqrt(sizes[0] * sizes[1]) / img_shape[1]
         di += 1
-    for i, r in enumerate(ratios):
-        h[i+di] = sizes[0] / img_shape[0] / math.sqrt(r)
-        w[i+di] = sizes[0] / img_shape[1] * math.sqrt(r)
-        
-    
-    all_xs = []
-    all_ys = []
-    all_heights = []
-    all_widths = []
-    anchors = np.zeros((feat_shape[0], feat_shape[1], num_anchors, 4))
-    for di in xrange(num_anchors):
-        anchors[:, :, di, 0] = x.copy()
-        anchors[:, :, di, 1] = y.copy()
-        anchors[:, :, di, 2] = w[di]
-        anchors[:, :, di, 3] = h[di]
-    
-    anchors = np.reshape(anchors, [-1, 4])
-    return anchors
+    sqrt_ratios = np.sqrt(np.asarray(ratios, dtype=np.float64))
+    h[di:] = sizes[0] / img_shape[0] / sqrt_ratios
+    w[di:] = sizes[0] / img_shape[1] * sqrt_ratios
+
+    # Broadcast the grids and sizes to (H, W, num_anchors) and flatten.
+    shape = (feat_shape[0], feat_shape[1], num_anchors)
+    x = np.broadcast_to(x[..., np.newaxis], shape).ravel()
+    y = np.broadcast_to(y[..., np.newaxis], shape).ravel()
+    w = np.broadcast_to(w, shape).ravel()
+    h = np.broadcast_to(h, shape).ravel()
+    return x, y, w, h
 
 
 def ssd_anchors_all_layers(img_shape,
@@ -346,6 +379,10 @@ def ssd_anchors_all_layers(img_shape,
                            offset=0.5,
                            dtype=np.float32):
     """Compute anchor boxes for all feature layers.
+
+    Return:
+      Dictionary of contiguous 1D arrays, one per anchor component:
+        'cx', 'cy', 'w', 'h'.
     """
     layers_anchors = []
     for i, s in enumerate(layers_shape):
@@ -356,8 +393,54 @@ def ssd_anchors_all_layers(img_shape,
                                              offset=offset, dtype=dtype)
         layers_anchors.append(anchor_bboxes)
 
-    all_anchors = np.vstack(layers_anchors)
+    all_anchors = {}
+    for i, key in enumerate(['cx', 'cy', 'w', 'h']):
+        all_anchors[key] = np.concatenate([a[i] for a in layers_anchors])
     return all_anchors
+
+
+def ssd_anchors_cached(img_shape,
+                       layers_shape,
+                       anchor_sizes,
+                       anchor_ratios,
+                       anchor_steps,
+                       offset=0.5,
+                       dtype=np.float32,
+                       cache_dir=ANCHORS_CACHE_DIR):
+    """Same as `ssd_anchors_all_layers`, but memory-mapped from a .npy file
+    of `cache_dir` when it exists. The file is named after a hash of the
+    anchors parameters, and written on the first call otherwise.
+    """
+    params = repr((ANCHORS_CACHE_VERSION, tuple(img_shape), layers_shape,
+                   anchor_sizes, anchor_ratios, anchor_steps, offset,
+                   np.dtype(dtype).str))
+    digest = hashlib.md5(params.encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(cache_dir, 'ssd_vgg_512_anchors_%s.npy' % digest)
+    keys = ['cx', 'cy', 'w', 'h']
+    if os.path.exists(path):
+        anchors = np.load(path, mmap_mode='r')
+    else:
+        all_anchors = ssd_anchors_all_layers(img_shape, layers_shape,
+                                             anchor_sizes, anchor_ratios,
+                                             anchor_steps, offset, dtype)
+        anchors = np.stack([all_anchors[k] for k in keys])
+        # Write to a temporary file first: other processes may read it.
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, anchors)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            logging.warning('Can not write the anchors cache file %s', path)
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    # Rows of the (4, N) array: contiguous components.
+    return dict(zip(keys, anchors))
+
+
 def tensor_shape(x, rank=3):
     """Returns the dimensions of a tensor.
     Args:
@@ -384,22 +467,47 @@ def ssd_multibox_layer(inputs,
     """
     net = inputs
     if normalization > 0:
-        net = tf.nn.l2_normalize(net, -1) * normalization
+        # Normalize in float32: in fp16, the sum of squares of the block4
+        # activations overflows and the epsilon rounds to zero.
+        dtype = net.dtype
+        net = custom_layers.l2_normalization(
+            tf.cast(net, tf.float32), scaling=True)
+        net = tf.cast(net, dtype)
     # Number of anchors.
     num_anchors = len(sizes) + len(ratios)
-    # Location.
+    # Location and class predictions, computed by a single convolution.
     num_loc_pred = num_anchors * 4
-    loc_pred = slim.conv2d(net, num_loc_pred, [3, 3], activation_fn=None, scope='conv_loc')
-    loc_pred = custom_layers.channel_to_last(loc_pred)
-    loc_pred = tf.reshape(loc_pred, tensor_shape(loc_pred, 4)[:-1]+[num_anchors, 4]) # reshaped to (batch_size, h, w, num_anchors, 4)
-    
-    # Class prediction.
     num_cls_pred = num_anchors * num_classes
-    cls_pred = slim.conv2d(net, num_cls_pred, [3, 3], activation_fn=None, scope='conv_cls')
-    cls_pred = custom_layers.channel_to_last(cls_pred)
-    cls_pred = tf.reshape(cls_pred, tensor_shape(cls_pred, 4)[:-1]+[num_anchors, num_classes])# reshaped to (batch_size, h, w, num_anchors, num_classes)
+    pred = slim.conv2d(net, num_loc_pred + num_cls_pred, [3, 3],
+                       activation_fn=None, scope='conv_combined')
+    pred = custom_layers.channel_to_last(pred)
+    # The feature map size is static unless the input size is not: only
+    # fall back to dynamic shapes in that case.
+    height, width = pred.get_shape().as_list()[1:3]
+    if height is None or width is None:
+        height, width = tensor_shape(pred, 4)[1:3]
+    loc_pred, cls_pred = tf.split(pred, [num_loc_pred, num_cls_pred], axis=-1)
+    loc_pred = tf.reshape(loc_pred, [-1, height, width, num_anchors, 4]) # reshaped to (batch_size, h, w, num_anchors, 4)
+    cls_pred = tf.reshape(cls_pred, [-1, height, width, num_anchors, num_classes])# reshaped to (batch_size, h, w, num_anchors, num_classes)
     return cls_pred, loc_pred
 
+
+def conv3x3_stride2(inputs, num_outputs, caffe_padding=False,
+                    scope='conv3x3'):
+    """3x3 convolution with stride 2 of the SSD extra blocks.
+
+    'SAME' padding by default, which is handled inside the convolution
+    kernel. With `caffe_padding`, explicit (1, 1) padding followed by a
+    'VALID' convolution as in the Caffe model: same output shape for even
+    input sizes, but the sampling grid is shifted by one pixel.
+    """
+    if caffe_padding:
+        net = custom_layers.pad2d(inputs, pad=(1, 1))
+        return slim.conv2d(net, num_outputs, [3, 3], stride=2,
+                           scope=scope, padding='VALID')
+    return slim.conv2d(inputs, num_outputs, [3, 3], stride=2, scope=scope)
+
+
 # =========================================================================== #
 # Functional definition of VGG-based SSD 512.
 # =========================================================================== #
@@ -413,12 +521,33 @@ def ssd_net(inputs,
             dropout_keep_prob=0.5,
             prediction_fn=slim.softmax,
             reuse=None,
+            precision='fp32',
+            caffe_padding=False,
             scope='ssd_512_vgg'):
     """SSD net definition.
+
+    The convolutions run in the `data_format` of the arg_scope, NCHW being
+    the fastest layout for cuDNN. The multibox outputs are always NHWC.
+
+    With `precision` set to 'fp16', the network is computed in half
+    precision (use NHWC so cuDNN picks the Tensor Cores kernels),
+    with float32 master weights. Outputs are cast back to float32.
+
+    `caffe_padding` restores the explicit (1, 1) padding of the Caffe model
+    in the stride 2 convolutions of blocks 8 to 11, instead of 'SAME'.
     """
+    if precision not in PRECISION_DTYPES:
+        raise ValueError('Unknown precision: %s (expected one of %s)'
+                         % (precision, ', '.join(sorted(PRECISION_DTYPES))))
+    compute_dtype = PRECISION_DTYPES[precision]
+    custom_getter = None
+    if compute_dtype != tf.float32:
+        custom_getter = custom_layers.float32_variable_getter
     # End_points collect relevant activations for external use.
     end_points = {}
-    with tf.variable_scope(scope, 'ssd_512_vgg', [inputs], reuse=reuse):
+    with tf.variable_scope(scope, 'ssd_512_vgg', [inputs], reuse=reuse,
+                           custom_getter=custom_getter):
+        inputs = tf.cast(inputs, compute_dtype)
         # Original VGG-16 blocks.
         net = slim.repeat(inputs, 2, slim.conv2d, 64, [3, 3], scope='conv1')
         end_points['block1'] = net
@@ -452,26 +581,22 @@ def ssd_net(inputs,
         end_point = 'block8'
         with tf.variable_scope(end_point):
             net = slim.conv2d(net, 256, [1, 1], scope='conv1x1')
-            net = custom_layers.pad2d(net, pad=(1, 1))
-            net = slim.conv2d(net, 512, [3, 3], stride=2, scope='conv3x3', padding='VALID')
+            net = conv3x3_stride2(net, 512, caffe_padding=caffe_padding)
         end_points[end_point] = net
         end_point = 'block9'
         with tf.variable_scope(end_point):
             net = slim.conv2d(net, 128, [1, 1], scope='conv1x1')
-            net = custom_layers.pad2d(net, pad=(1, 1))
-            net = slim.conv2d(net, 256, [3, 3], stride=2, scope='conv3x3', padding='VALID')
+            net = conv3x3_stride2(net, 256, caffe_padding=caffe_padding)
         end_points[end_point] = net
         end_point = 'block10'
         with tf.variable_scope(end_point):
             net = slim.conv2d(net, 128, [1, 1], scope='conv1x1')
-            net = custom_layers.pad2d(net, pad=(1, 1))
-            net = slim.conv2d(net, 256, [3, 3], stride=2, scope='conv3x3', padding='VALID')
+            net = conv3x3_stride2(net, 256, caffe_padding=caffe_padding)
         end_points[end_point] = net
         end_point = 'block11'
         with tf.variable_scope(end_point):
             net = slim.conv2d(net, 128, [1, 1], scope='conv1x1')
-            net = custom_layers.pad2d(net, pad=(1, 1))
-            net = slim.conv2d(net, 256, [3, 3], stride=2, scope='conv3x3', padding='VALID')
+            net = conv3x3_stride2(net, 256, caffe_padding=caffe_padding)
         end_points[end_point] = net
         end_point = 'block12'
         with tf.variable_scope(end_point):
@@ -493,7 +618,8 @@ def ssd_net(inputs,
                                                       anchor_sizes[i],
                                                       anchor_ratios[i],
                                                       normalizations[i])
-            
+            p = tf.cast(p, tf.float32)
+            l = tf.cast(l, tf.float32)
             predictions.append(prediction_fn(p))
             logits.append(p)
             localizations.append(l)
@@ -505,18 +631,20 @@ def ssd_net(inputs,
 ssd_net.default_image_size = 512
 
 
-def ssd_arg_scope(weight_decay=0.0005, data_format='NHWC'):
+def ssd_arg_scope(weight_decay=0.0005, data_format='NHWC', l2_norm_scale=20.):
     """Defines the VGG arg scope.
 
     Args:
       weight_decay: The l2 regularization coefficient.
+      l2_norm_scale: Initial scale of the L2 normalization layers.
 
     Returns:
       An arg_scope.
     """
     with slim.arg_scope([slim.conv2d, slim.fully_connected],
                         activation_fn=tf.nn.relu,
-                        weights_regularizer=slim.l2_regularizer(weight_decay),
+                        weights_regularizer=custom_layers.float32_regularizer(
+                            slim.l2_regularizer(weight_decay)),
                         weights_initializer=tf.contrib.layers.xavier_initializer(),
                         biases_initializer=tf.zeros_initializer()):
         with slim.arg_scope([slim.conv2d, slim.max_pool2d],
@@ -525,8 +653,10 @@ def ssd_arg_scope(weight_decay=0.0005, data_format='NHWC'):
             with slim.arg_scope([custom_layers.pad2d,
                                  custom_layers.l2_normalization,
                                  custom_layers.channel_to_last],
-                                data_format=data_format) as sc:
-                return sc
+                                data_format=data_format):
+                with slim.arg_scope([custom_layers.l2_normalization],
+                                    scale_initializer=tf.constant_initializer(l2_norm_scale)) as sc:
+                    return sc
 
 # =========================================================================== #
 # Caffe scope: importing weights at initialization.
@@ -559,23 +689,21 @@ def ssd_arg_scope_caffe(caffe_scope):
 # =========================================================================== #
 
 def reshape_and_concat(tensors):
-    def get_shape(tensor):
-        if len(tensor.shape) == 5:
-            shape = (tf.shape(tensor)[0], -1, tf.shape(tensor)[-1])
-        else:
-            raise ValueError, "invalid input shape:" + str(tensor.shape)
-        return shape
-        
-    tensors_reshaped = [tf.reshape(tensor, get_shape(tensor)) for tensor in tensors]
-    all_tensors = tf.concat(tensors_reshaped, axis = 1)
-    
-    return all_tensors
-    
+    """Flatten the (batch_size, h, w, num_anchors, C) heads to
+    (batch_size, h * w * num_anchors, C) and concatenate them along the
+    anchors axis.
+    """
+    flat = [tf.reshape(t, [tf.shape(t)[0], -1, t.shape[-1].value])
+            for t in tensors]
+    return tf.concat(flat, axis=1)
+
+
 def ssd_losses(confidences, logits, localizations,
                gclasses, glocalizations, gscores,
                negative_ratio=3.,
                alpha=1.,
                label_smoothing=0.,
+               add_summaries=True,
                scope=None):
     """Loss functions for training the SSD 512 VGG network.
 
@@ -588,6 +716,7 @@ def ssd_losses(confidences, logits, localizations,
       gclasses: (list of) groundtruth labels Tensors;
       glocalizations: (list of) groundtruth localizations Tensors;
       gscores: (list of) groundtruth score Tensors;
+      add_summaries: whether to add the hard negative mining summaries.
     """
     
     with tf.name_scope(scope, 'ssd_losses'):
@@ -595,46 +724,39 @@ def ssd_losses(confidences, logits, localizations,
 
         pos_mask = gclasses > 0
         neg_mask = tf.logical_not(pos_mask)
-        # if negative, return score of being background; else, return 0
         float_pos_mask = tf.cast(pos_mask, dtype)
-        nvalues = tf.where(neg_mask, confidences[:, :, 0], float_pos_mask)
-        
-        selected_neg = []
-
-        batch_size = tensor_shape(gclasses)[0]
-        for img_idx in xrange(batch_size):
-            img_neg_conf = nvalues[img_idx, :]
-            img_pos_mask = pos_mask[img_idx, :]
-            img_neg_mask = neg_mask[img_idx, :]
-            img_float_pos_mask = tf.cast(img_pos_mask, dtype)
-            img_float_neg_mask = tf.cast(img_neg_mask, dtype)
-            n_pos = tf.reduce_sum(img_float_pos_mask)
-            
-            def has_pos():
-                n_neg = n_pos * negative_ratio
-                max_neg_entries = tf.reduce_sum(img_float_neg_mask)
-                n_neg = tf.minimum(max_neg_entries, n_neg)
-                n_neg = tf.cast(n_neg, tf.int32)
-                val, indexes = tf.nn.top_k(-img_neg_conf, k=n_neg)
-                min_val = val[-1]
-                selected_img_neg = tf.logical_and(img_neg_mask, img_neg_conf <= -min_val)
-                return tf.cast(selected_img_neg, dtype)
-            def no_pos():
-                return tf.zeros_like(img_float_pos_mask, dtype)
-                
-            selected_img_neg = tf.cond(n_pos > 0, has_pos, no_pos)
-            selected_neg.append(selected_img_neg)
-                
-        selected_neg = tf.stack(selected_neg)
+        # Background score of the negatives. Positives are pushed to >= 1,
+        # above any negative score, so that the mining never picks them.
+        nvalues = confidences[:, :, 0] + float_pos_mask
+
+        # Hard negative mining, batched over the images: keep in every
+        # image the n_neg negatives with the lowest background score.
+        n_pos_per_img = tf.reduce_sum(float_pos_mask, axis=1)
+        num_anchors = tf.cast(tf.shape(float_pos_mask)[1], dtype)
+        n_neg_per_img = tf.minimum(num_anchors - n_pos_per_img,
+                                   n_pos_per_img * negative_ratio)
+        n_neg_per_img = tf.cast(n_neg_per_img, tf.int32)
+        max_n_neg = tf.maximum(tf.reduce_max(n_neg_per_img), 1)
+        val, _ = tf.nn.top_k(-nvalues, k=max_n_neg)
+        # Background score of the n_neg-th hardest negative of every image.
+        batch_idx = tf.range(tf.shape(nvalues)[0])
+        thresh_idx = tf.maximum(n_neg_per_img - 1, 0)
+        max_neg_val = -tf.gather_nd(val, tf.stack([batch_idx, thresh_idx], axis=1))
+        selected_neg_mask = tf.logical_and(neg_mask,
+                                           nvalues <= tf.expand_dims(max_neg_val, axis=1))
+        # Images without positive anchors get no negatives either.
+        selected_neg_mask = tf.logical_and(selected_neg_mask,
+                                           tf.expand_dims(n_neg_per_img > 0, axis=1))
+        selected_neg = tf.cast(selected_neg_mask, dtype)
         cls_weight = selected_neg + float_pos_mask
-        tf.summary.histogram('negative_iou', (cls_weight - float_pos_mask) * gscores)
-        tf.summary.scalar('negative_postive_ratio', tf.reduce_sum(selected_neg) / tf.reduce_sum(float_pos_mask))
-        tf.summary.scalar('percent_instances', tf.reduce_sum(cls_weight) / tf.cast(tf.reduce_prod(tf.shape(cls_weight)), dtype))
-        tf.summary.scalar('number_of_instances', tf.reduce_sum(cls_weight))
+        N = tf.reduce_sum(n_pos_per_img)
+        if add_summaries:
+            tf.summary.histogram('negative_iou', selected_neg * gscores)
+            tf.summary.scalar('negative_postive_ratio', tf.reduce_sum(selected_neg) / N)
+            tf.summary.scalar('percent_instances', tf.reduce_sum(cls_weight) / tf.cast(tf.reduce_prod(tf.shape(cls_weight)), dtype))
+            tf.summary.scalar('number_of_instances', tf.reduce_sum(cls_weight))
         # Add cross-entropy loss.
         
-        N = tf.reduce_sum(float_pos_mask)
-        
         """
         cls_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(logits = logits, labels = gclasses)
         with tf.name_scope('cross_entropy_pos'):
@@ -644,18 +766,23 @@ def ssd_losses(confidences, logits, localizations,
         """ 
         with tf.name_scope('cross_entropy'):            
             def has_pos():
-                cls_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(logits = logits, labels = gclasses)
-                return tf.reduce_sum(cls_loss * cls_weight) / N
+                # Only positives and mined negatives have a non-zero weight.
+                keep_mask = tf.logical_or(pos_mask, selected_neg_mask)
+                cls_loss = tf.nn.sparse_softmax_cross_entropy_with_logits(
+                    logits=tf.boolean_mask(logits, keep_mask),
+                    labels=tf.boolean_mask(gclasses, keep_mask))
+                return tf.reduce_sum(cls_loss * tf.boolean_mask(cls_weight, keep_mask)) / N
             def no_pos():
                 return tf.constant(.0);
             cls_loss = tf.cond(N > 0, has_pos, no_pos, name = 'cls_loss')
             tf.add_to_collection(tf.GraphKeys.LOSSES, cls_loss)
         with tf.name_scope('localization'):
             def has_pos():
-                weights = tf.expand_dims(float_pos_mask, axis=-1)
-                loc_loss = custom_layers.abs_smooth(localizations - glocalizations)
-    #            loss = tf.losses.compute_weighted_loss(loss, weights)
-                return alpha * tf.reduce_sum(loc_loss * weights) / N
+                # Smooth L1 on the positive anchors only.
+                pos_localizations = tf.boolean_mask(localizations, pos_mask)
+                pos_glocalizations = tf.boolean_mask(glocalizations, pos_mask)
+                loc_loss = custom_layers.abs_smooth(pos_localizations - pos_glocalizations)
+                return alpha * tf.reduce_sum(loc_loss) / N
             def no_pos():
                 return tf.constant(.0);
             loc_loss = tf.cond(N > 0, has_pos, no_pos, name = 'loc_loss')
@@ -31,7 +31,6 @@ from preprocessing import preprocessing_factory
 
 slim = tf.contrib.slim
 
-DATA_FORMAT = 'NHWC'
 # =========================================================================== #
 # SSD evaluation Flags.
 # =========================================================================== #
@@ -93,13 +92,20 @@ tf.app.flags.DEFINE_boolean(
 
 tf.app.flags.DEFINE_boolean(
     'test_all_checkpoints', False, 'test all existed ckpts')
+tf.app.flags.DEFINE_string(
+    'data_format', 'NHWC',
+    'Data format of the network, "NHWC" or "NCHW" (GPU only).')
+tf.app.flags.DEFINE_boolean(
+    'caffe_padding', False,
+    'Explicit (1, 1) padding of the Caffe model in the stride 2 convolutions '
+    'of blocks 8 to 11, instead of SAME. Must match the training setting.')
 
 FLAGS = tf.app.flags.FLAGS
 keep_thresholds = [float(v) for v in FLAGS.keep_threshold.split(',')]
 nms_thresholds = [float(v) for v in FLAGS.nms_threshold.split(',')]
 
     
-def test(ckpt_path, data_provider, keep_threshold, nms_threshold):
+def test(ckpt_path, data_provider, keep_threshold, nms_threshold, data_format):
 
     with tf.Graph().as_default():
         tf_global_step = slim.get_or_create_global_step()
@@ -108,14 +114,13 @@ def test(ckpt_path, data_provider, keep_threshold, nms_threshold):
         # SSD model + Pre-processing
         # =================================================================== #
 
-        # Get the SSD network and its anchors.
+        # Get the SSD network.
         ssd_class = nets_factory.get_network(FLAGS.model_name)
         ssd_params = ssd_class.default_params._replace(num_classes=FLAGS.num_classes)
         ssd_net = ssd_class(ssd_params)
 
-        # Evaluation shape and associated anchors: eval_image_size
+        # Evaluation shape: eval_image_size
         ssd_shape = ssd_net.params.img_shape
-        ssd_anchors = ssd_net.anchors(ssd_shape)
 
         # Select the preprocessing function.
         preprocessing_name = FLAGS.preprocessing_name or FLAGS.model_name
@@ -132,21 +137,22 @@ def test(ckpt_path, data_provider, keep_threshold, nms_threshold):
             image_processed, glabels, gbboxes, gbbox_img = \
                 image_preprocessing_fn(image, glabels, gbboxes,
                                        out_shape=ssd_shape,
-                                       data_format=DATA_FORMAT,
+                                       data_format=data_format,
                                        resize=FLAGS.eval_resize,
                                        difficults=None)
                                        
            # gclasses, glocalizations, gscores = \
-           #     ssd_net.bboxes_encode(glabels, gbboxes, ssd_anchors, match_threshold = FLAGS.matching_threshold)
+           #     ssd_net.bboxes_encode(glabels, gbboxes, anchors, match_threshold = FLAGS.matching_threshold)
 
             image_processed = tf.expand_dims(image_processed, 0)
         # =================================================================== #
         # SSD Network + Ouputs decoding.
         # =================================================================== #
-        arg_scope = ssd_net.arg_scope(data_format=DATA_FORMAT)
+        arg_scope = ssd_net.arg_scope(data_format=data_format)
         with slim.arg_scope(arg_scope):
             predictions, localisations, logits, end_points = \
-                ssd_net.net(image_processed, is_training=False)
+                ssd_net.net(image_processed, is_training=False,
+                            caffe_padding=FLAGS.caffe_padding)
         #neg_pred = tf.zeros_like(gscores)
         #predictions = tf.stack([neg_pred, gscores])
         #predictions = tf.transpose(predictions)
@@ -154,7 +160,8 @@ def test(ckpt_path, data_provider, keep_threshold, nms_threshold):
         # Performing post-processing on CPU: loop-intensive, usually more efficient.
         with tf.device('/device:CPU:0'):
             # Detected objects from SSD output.
-            localisations = ssd_net.bboxes_decode(localisations, ssd_anchors)
+            anchors = ssd_net.anchors_tensors(ssd_shape)
+            localisations = ssd_net.bboxes_decode(localisations, anchors)
             rscores, rbboxes = ssd_net.detected_bboxes(predictions, localisations,
                                         select_threshold=FLAGS.select_threshold,
                                         nms_threshold=nms_threshold,
@@ -280,7 +287,8 @@ def main(_):
             for keep_threshold in keep_thresholds:
                 for nms_threshold in nms_thresholds:
                     data_provider.reset()
-                    test(ckpt_path, data_provider, keep_threshold, nms_threshold)
+                    test(ckpt_path, data_provider, keep_threshold, nms_threshold,
+                         FLAGS.data_format)
             if not FLAGS.wait_for_checkpoints:
                 break;
     else:
@@ -288,7 +296,8 @@ def main(_):
             for keep_threshold in keep_thresholds:
                 for nms_threshold in nms_thresholds:
                     data_provider.reset()
-                    test(ckpt_path, data_provider, keep_threshold, nms_threshold)
+                    test(ckpt_path, data_provider, keep_threshold, nms_threshold,
+                         FLAGS.data_format)
             
 if __name__ == '__main__':
     tf.app.run()
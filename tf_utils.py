@@ -19,6 +19,7 @@ import os
 
 from pprint import pprint
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.contrib.slim.python.slim.data import parallel_reader
 
@@ -57,6 +58,19 @@ def reshape_list(l, shape=None):
     return r
 
 
+def get_data_format(on_cpu=False, precision='fp32'):
+    """Pick the data format of the network convolutions.
+
+    NCHW on GPU in fp32, as it maps to the fastest cuDNN kernels, and NHWC
+    otherwise: the only layout supported by the CPU kernels, and the one
+    used by the fp16 Tensor Cores kernels. The devices are not probed
+    (it would create the GPU allocator with the default session options).
+    """
+    if on_cpu or precision != 'fp32':
+        return 'NHWC'
+    return 'NCHW'
+
+
 # =========================================================================== #
 # Training utils.
 # =========================================================================== #
@@ -140,6 +154,63 @@ def update_model_scope(var, ckpt_scope, new_scope):
     return var.op.name.replace(new_scope,'vgg_16')
 
 
+def get_fused_multibox_value(reader, name):
+    """Value of a fused `conv_combined` multibox tensor (variable, optimizer
+    slot or moving average) read from a checkpoint holding separate
+    `conv_loc` and `conv_cls` ones: both concatenated along the output
+    channels axis, localizations first.
+
+    Args:
+      reader: Checkpoint reader;
+      name: Checkpoint name of the fused tensor.
+    Return:
+      Numpy array, None if it can not be built from the checkpoint.
+    """
+    if 'conv_combined' not in name:
+        return None
+    loc_name = name.replace('conv_combined', 'conv_loc')
+    cls_name = name.replace('conv_combined', 'conv_cls')
+    if not (reader.has_tensor(loc_name) and reader.has_tensor(cls_name)):
+        return None
+    return np.concatenate([reader.get_tensor(loc_name),
+                           reader.get_tensor(cls_name)], axis=-1)
+
+
+def get_fused_multibox_assign_fn(reader, variables_to_restore):
+    """Restore the fused `conv_combined` multibox variables missing from a
+    checkpoint, c.f. `get_fused_multibox_value`. The values are fed through
+    placeholders, not embedded in the graph.
+
+    Args:
+      reader: Checkpoint reader;
+      variables_to_restore: Dictionary of checkpoint names to variables.
+    Return:
+      (assign_fn, names): function running the assignments given a session,
+        None if there is nothing to assign, and the checkpoint names handled.
+    """
+    assign_ops = []
+    feed_dict = {}
+    names = []
+    for name, var in variables_to_restore.items():
+        if reader.has_tensor(name):
+            continue
+        value = get_fused_multibox_value(reader, name)
+        if value is None:
+            continue
+        placeholder = tf.placeholder(var.dtype.base_dtype,
+                                     shape=var.get_shape())
+        assign_ops.append(tf.assign(var, placeholder))
+        feed_dict[placeholder] = value
+        names.append(name)
+    if not assign_ops:
+        return None, names
+    assign_op = tf.group(*assign_ops)
+
+    def callback(session):
+        session.run(assign_op, feed_dict=feed_dict)
+    return callback, names
+
+
 def get_init_fn(flags):
     """Returns a function run by the chief worker to warm-start the training.
     Note that the init_fn is only run when initializing the model during the very
@@ -182,10 +253,31 @@ def get_init_fn(flags):
         checkpoint_path = flags.checkpoint_path
     tf.logging.info('Fine-tuning from %s. Ignoring missing vars: %s' % (checkpoint_path, flags.ignore_missing_vars))
 
-    return slim.assign_from_checkpoint_fn(
+    if not isinstance(variables_to_restore, dict):
+        variables_to_restore = {var.op.name: var for var in variables_to_restore}
+    # Checkpoints with separate conv_loc / conv_cls multibox layers.
+    reader = tf.train.NewCheckpointReader(checkpoint_path)
+    fused_assign_fn, fused_names = get_fused_multibox_assign_fn(
+        reader, variables_to_restore)
+    for name in fused_names:
+        del variables_to_restore[name]
+    # Checkpoints without the learned L2 normalization scales: keep the
+    # initial value of the variables, i.e. the layer normalization.
+    for name in list(variables_to_restore.keys()):
+        if name.endswith('L2Normalization/gamma') and not reader.has_tensor(name):
+            del variables_to_restore[name]
+
+    init_fn = slim.assign_from_checkpoint_fn(
         checkpoint_path,
         variables_to_restore,
         ignore_missing_vars=flags.ignore_missing_vars)
+    if fused_assign_fn is None:
+        return init_fn
+
+    def callback(session):
+        init_fn(session)
+        fused_assign_fn(session)
+    return callback
 
 
 def get_variables_to_train(flags):
@@ -13,6 +13,8 @@
 # limitations under the License.
 # ==============================================================================
 """Generic training script that trains a SSD model using a given dataset."""
+import os
+
 import numpy
 import tensorflow as tf
 from tensorflow.python.ops import control_flow_ops
@@ -24,8 +26,7 @@ from nets import nets_factory
 import tf_utils
 import util
 slim = tf.contrib.slim
- 
-DATA_FORMAT = 'NCHW'
+
 
 # =========================================================================== #
 # SSD Network flags.
@@ -38,7 +39,24 @@ tf.app.flags.DEFINE_float(
     'negative_ratio', 3., 'Negative ratio in the loss function.')
 tf.app.flags.DEFINE_float(
     'match_threshold', 0.25, 'Matching threshold in the loss function.')
+tf.app.flags.DEFINE_boolean(
+    'loss_summaries', True, 'Add the hard negative mining summaries of the loss function.')
 tf.app.flags.DEFINE_integer('num_gpus', 1, 'The number of gpus can be used.')
+tf.app.flags.DEFINE_string(
+    'precision', 'fp32',
+    'Compute precision of the network, one of "fp32" or "fp16".')
+tf.app.flags.DEFINE_float(
+    'loss_scale', 1.0,
+    'Static loss scale, to keep the fp16 gradients from underflowing '
+    '(e.g. 128 with --precision=fp16).')
+tf.app.flags.DEFINE_boolean(
+    'tensor_op_math_fp32', False,
+    'Allow Tensor Cores (reduced internal precision) in the fp32 '
+    'convolutions and matmuls.')
+tf.app.flags.DEFINE_boolean(
+    'caffe_padding', False,
+    'Explicit (1, 1) padding of the Caffe model in the stride 2 convolutions '
+    'of blocks 8 to 11, instead of SAME.')
 # =========================================================================== #
 # General Flags.
 # =========================================================================== #
@@ -163,6 +181,13 @@ def main(_):
         raise ValueError('If multi gpus are used, the batch_size should be a multiple of the number of gpus.')
     batch_size = FLAGS.batch_size / num_clones;
     print "%d images per GPU"%(batch_size)
+    # NCHW on GPU for the cuDNN kernels, NHWC on CPU and in reduced precision.
+    data_format = tf_utils.get_data_format(on_cpu=FLAGS.clone_on_cpu,
+                                           precision=FLAGS.precision)
+    if FLAGS.tensor_op_math_fp32:
+        # Read by TensorFlow when it first runs the cuBLAS / cuDNN kernels.
+        os.environ.setdefault('TF_ENABLE_CUBLAS_TENSOR_OP_MATH_FP32', '1')
+        os.environ.setdefault('TF_ENABLE_CUDNN_TENSOR_OP_MATH_FP32', '1')
     
     with tf.Graph().as_default():
         # Config model_deploy. Keep TF Slim Models structure.
@@ -217,11 +242,13 @@ def main(_):
             # Pre-processing image, labels and bboxes.
             image, glabels, gbboxes, _ = image_preprocessing_fn(image, glabels, gbboxes,
                                        out_shape=ssd_shape,
-                                       data_format=DATA_FORMAT)
+                                       data_format=data_format)
             image = tf.identity(image, 'processed_image')
-            # Encode groundtruth labels and bboxes.
-            gclasses, glocalizations, gscores = ssd_net.bboxes_encode(glabels, gbboxes, ssd_anchors, match_threshold = FLAGS.match_threshold)
-            batch_shape = [1] + [len(ssd_anchors)] * 3
+            # Encode groundtruth labels and bboxes, with the anchors as
+            # constants of the input device.
+            anchors = ssd_net.anchors_tensors(ssd_shape)
+            gclasses, glocalizations, gscores = ssd_net.bboxes_encode(glabels, gbboxes, anchors, match_threshold = FLAGS.match_threshold)
+            batch_shape = [1] + [len(ssd_anchors['cx'])] * 3
             # Training batches and queue.
 #                tf_utils.reshape_list([image, gclasses, glocalizations, gscores]),
             b_image, b_gclasses, b_glocalizations, b_gscores = tf.train.batch(
@@ -249,9 +276,11 @@ def main(_):
             t_batch_size = tf.shape(b_image)[0] * num_clones
             # Construct SSD network.
             arg_scope = ssd_net.arg_scope(weight_decay=FLAGS.weight_decay,
-                                          data_format=DATA_FORMAT)
+                                          data_format=data_format)
             with slim.arg_scope(arg_scope):
-                confidences, localizations, logits, end_points = ssd_net.net(b_image, is_training=True) 
+                confidences, localizations, logits, end_points = ssd_net.net(b_image, is_training=True,
+                                                                             precision=FLAGS.precision,
+                                                                             caffe_padding=FLAGS.caffe_padding)
             # Add loss function.
             #confidences = tf.Print(confidences, ["shape of confidences(b, N, n_cls)", tf.shape(confidences)])
             #b_gscores = tf.Print(b_gscores, ["shape of b_gscores:(b, N, 1)", tf.shape(b_gscores)])
@@ -261,7 +290,8 @@ def main(_):
                            b_gclasses, b_glocalizations, b_gscores,
                            match_threshold=FLAGS.match_threshold,
                            negative_ratio=FLAGS.negative_ratio,
-                           alpha=FLAGS.loss_alpha)
+                           alpha=FLAGS.loss_alpha,
+                           add_summaries=FLAGS.loss_summaries)
             return end_points
 
         tf.summary.scalar('batch_size_per_gpu', t_batch_size)
@@ -326,6 +356,7 @@ def main(_):
         total_loss, ssd_loss, clones_gradients = model_deploy.optimize_clones(
             clones,
             optimizer,
+            loss_scale=FLAGS.loss_scale,
             var_list=variables_to_train)
         summaries |= set(model_deploy._add_gradients_summaries(clones_gradients))
         # Add total_loss to summary.